@@ -0,0 +1,649 @@
+"""Local benchmarks for the security bot.
+
+Run with ``python bench.py``. No Discord connection or token is needed:
+the replay suite drives the real handlers with fake guild, member and
+channel objects whose API calls go through a stub HTTP layer that
+simulates per-route and global rate limits.
+
+    python bench.py                 # micro + replay, CI-sized
+    python bench.py --full          # larger replays (500 channels, 2k-join raid)
+    python bench.py --only replay --json bench_output.json
+
+Replay memory is measured with tracemalloc, which slows allocation-heavy
+scenarios; pass ``--no-memory`` for undistorted latencies.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import discord
+import numpy as np
+
+import bot
+from bot import CONFIG, AutoModEngine, MemberIndex, MemberLite, RaidDetector, RateWindow
+
+
+# Micro benchmarks
+def bench_rate_window(events: int, keys: int, rate: float = 100_000.0):
+    windows = RateWindow()
+    rng = random.Random(0)
+    key_pool = [(1, user_id, action)
+                for user_id in range(keys)
+                for action in ("bans", "kicks", "channel_deletes")]
+    stream = [rng.choice(key_pool) for _ in range(events)]
+    step = 1.0 / rate
+    now = 0.0
+    start = time.perf_counter()
+    for key in stream:
+        now += step
+        windows.hit(key, 30, now)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(windows)
+
+
+def bench_auto_mod(messages: int, users: int, terms: int = 500):
+    CONFIG["guild_overrides"]["1"] = {"auto_mod": {"banned_terms": [f"badword{i}" for i in range(terms)]}}
+    engine = AutoModEngine()
+    rng = random.Random(0)
+    words = ["hello", "raid", "anyone", "playing", "tonight", "lol", "check", "this", "out"]
+    samples = [" ".join(rng.choice(words) for _ in range(rng.randint(3, 30))) for _ in range(1000)]
+    samples += ["join discord.gg/abcdef now", "you are a badword42", "spam spam spam"] * 10
+    stream = [(rng.randrange(users), rng.choice(samples), rng.randint(0, 2)) for _ in range(messages)]
+    now = 0.0
+    violations = 0
+    start = time.perf_counter()
+    for user_id, content, mentions in stream:
+        now += 0.001
+        if engine.scan(1, user_id, content, mentions, now):
+            violations += 1
+    elapsed = time.perf_counter() - start
+    del CONFIG["guild_overrides"]["1"]
+    bot._guild_configs.pop(1, None)
+    return elapsed, violations
+
+
+def bench_raid_scoring(joins: int, batch_size: int):
+    rng = random.Random(0)
+    names = [f"raider{rng.randrange(10_000)}" if rng.random() < 0.8 else f"member_{i}" for i in range(joins)]
+    ages = np.array([rng.random() * 30 for _ in range(joins)])
+    avatars = np.array([float(rng.random() < 0.7) for _ in range(joins)])
+    start = time.perf_counter()
+    for i in range(0, joins, batch_size):
+        skeletons = [RaidDetector.skeleton(name) for name in names[i:i + batch_size]]
+        RaidDetector.score_batch(ages[i:i + batch_size], avatars[i:i + batch_size], skeletons, CONFIG["raid"])
+    return time.perf_counter() - start
+
+
+def bench_scheduler(jobs: int):
+    # In-memory states: this measures the heap, not the journal
+    scheduler = bot.Scheduler(bot.GuildStates(None), batch=jobs)
+    rng = random.Random(0)
+    due = [rng.uniform(0, 86400) for _ in range(jobs)]
+    start = time.perf_counter()
+    for i, at in enumerate(due):
+        scheduler.schedule(i % 100, "unmute", at, i)
+    scheduled = time.perf_counter() - start
+    start = time.perf_counter()
+    popped = len(scheduler._pop_due(86400))
+    return scheduled, time.perf_counter() - start, popped
+
+
+async def bench_member_memory(members: int):
+    # Real discord.Member objects built from gateway payloads, no connection needed
+    from discord.http import HTTPClient
+    from discord.state import ConnectionState
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={},
+                            http=HTTPClient(asyncio.get_running_loop()), intents=discord.Intents.all())
+    role = {"id": "1", "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+            "hoist": False, "managed": False, "mentionable": False}
+    guild = discord.Guild(data={"id": "1", "name": "guild", "roles": [role]}, state=state)
+
+    def payload(i):
+        return {"user": {"id": str(10**17 + i), "username": f"member{i}", "discriminator": "0",
+                         "global_name": f"Member {i}", "avatar": "a" * 32},
+                "nick": None, "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+                "flags": 0}
+
+    def traced(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, kept
+
+    cache_bytes, cached = traced(lambda: [guild._add_member(discord.Member(data=payload(i), guild=guild, state=state))
+                                          for i in range(members)])
+    index_bytes, _ = traced(lambda: MemberIndex.from_members(guild.members))
+    lite_bytes, _ = traced(lambda: [MemberLite.of(member) for member in guild.members])
+    return cache_bytes, index_bytes, lite_bytes
+
+
+def run_micro():
+    print("RateWindow.hit (simulated 100k events/sec, 30s window)")
+    print(f"{'events':>10} {'keys':>8} {'ns/event':>10} {'events/sec':>12} {'live keys':>10}")
+    for events, keys in ((10_000, 100), (100_000, 1_000), (1_000_000, 10_000), (2_000_000, 50_000)):
+        elapsed, live = bench_rate_window(events, keys)
+        print(f"{events:>10} {keys:>8} {elapsed / events * 1e9:>10.0f} {events / elapsed:>12.0f} {live:>10}")
+
+    print()
+    print("AutoModEngine.scan (500 banned terms + invite filter, 1k msgs/sec simulated)")
+    print(f"{'messages':>10} {'users':>8} {'us/msg':>10} {'msgs/sec':>12} {'violations':>10}")
+    for messages, users in ((10_000, 100), (100_000, 5_000)):
+        elapsed, violations = bench_auto_mod(messages, users)
+        print(f"{messages:>10} {users:>8} {elapsed / messages * 1e6:>10.1f} {messages / elapsed:>12.0f} {violations:>10}")
+
+    print()
+    print("RaidDetector.score_batch (2,000 joins in 10s = 200 joins/sec)")
+    print(f"{'joins':>10} {'batch':>8} {'ms total':>10} {'us/join':>10}")
+    for joins, batch_size in ((2_000, 200), (20_000, 200), (20_000, 2_000)):
+        elapsed = bench_raid_scoring(joins, batch_size)
+        print(f"{joins:>10} {batch_size:>8} {elapsed * 1e3:>10.1f} {elapsed / joins * 1e6:>10.2f}")
+
+    print()
+    print("Scheduler (random due times over 24h, 100 guilds)")
+    print(f"{'jobs':>10} {'us/schedule':>12} {'us/pop':>10}")
+    for jobs in (10_000, 100_000, 500_000):
+        scheduled, drained, popped = bench_scheduler(jobs)
+        print(f"{jobs:>10} {scheduled / jobs * 1e6:>12.2f} {drained / popped * 1e6:>10.2f}")
+
+    print()
+    print("Member memory per 10k members (tracemalloc, no presences)")
+    print(f"{'members':>10} {'cache MB':>10} {'index MB':>10} {'lite MB':>10}")
+    for members in (10_000, 100_000):
+        cache_bytes, index_bytes, lite_bytes = asyncio.run(bench_member_memory(members))
+        scale = 10_000 / members / 2**20
+        print(f"{members:>10} {cache_bytes * scale:>10.2f} {index_bytes * scale:>10.2f} {lite_bytes * scale:>10.2f}")
+
+
+# Stub HTTP layer
+class FakeHTTP:
+    """Simulated Discord REST: fixed latency, per-route buckets and a global limit.
+
+    Requests over a bucket's limit wait for its reset the way discord.py
+    does after a 429, and are counted in ``rate_limited``. Interaction and
+    webhook routes are exempt from the global limit, as on Discord.
+    """
+
+    def __init__(self, latency: float = 0.002, route_limit: int = 5, route_window: float = 1.0, global_rate: int = 50):
+        self.latency = latency
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_rate = global_rate
+        self.requests = 0
+        self.rate_limited = 0
+        self._routes = {}
+        self._global = []
+
+    @staticmethod
+    def _take(bucket: list, limit: int, window: float, now: float) -> float:
+        while bucket and now - bucket[0] >= window:
+            bucket.pop(0)
+        if len(bucket) < limit:
+            bucket.append(now)
+            return 0.0
+        return window - (now - bucket[0])
+
+    async def request(self, method: str, route: str, major: int):
+        while True:
+            now = time.monotonic()
+            exempt = route.startswith(("/interactions", "/webhooks"))
+            wait = 0.0 if exempt else self._take(self._global, self.global_rate, 1.0, now)
+            if not wait:
+                bucket = self._routes.setdefault((method, route, major), [])
+                wait = self._take(bucket, self.route_limit, self.route_window, now)
+                if wait and not exempt:
+                    self._global.pop()
+            if not wait:
+                break
+            self.rate_limited += 1
+            await asyncio.sleep(wait)
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+
+# Fake discord objects
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, guild):
+        self.id = role_id
+        self.name = name
+        self.guild = guild
+        self.permissions = discord.Permissions.none()
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+
+class FakeMember:
+    def __init__(self, member_id: int, name: str, guild, http: FakeHTTP, roles=(), age_days: float = 365.0,
+                 avatar=True, administrator: bool = False):
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.guild = guild
+        self.roles = [guild.default_role, *roles]
+        self.avatar = "a" if avatar else None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=age_days)
+        self.guild_permissions = FakePermissions(administrator)
+        self.mention = f"<@{member_id}>"
+        self.joined_at = datetime.datetime.now(datetime.timezone.utc)
+        self._http = http
+
+    async def ban(self, **kwargs):
+        await self._http.request("PUT", "/guilds/{guild_id}/bans/{user_id}", self.guild.id)
+
+    async def kick(self, **kwargs):
+        await self._http.request("DELETE", "/guilds/{guild_id}/members/{user_id}", self.guild.id)
+
+    async def timeout(self, until, **kwargs):
+        await self._http.request("PATCH", "/guilds/{guild_id}/members/{user_id}", self.guild.id)
+
+    async def add_roles(self, *roles, **kwargs):
+        await self._http.request("PUT", "/guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild, http: FakeHTTP):
+        self.id = channel_id
+        self.name = f"channel-{channel_id}"
+        self.guild = guild
+        self._overwrites = {}
+        self._http = http
+        self.sent = 0
+
+    @property
+    def overwrites(self):
+        return dict(self._overwrites)
+
+    def overwrites_for(self, target):
+        return self._overwrites.get(target, discord.PermissionOverwrite())
+
+    async def set_permissions(self, target, *, overwrite=None, reason=None):
+        await self._http.request("PUT", "/channels/{channel_id}/permissions/{overwrite_id}", self.id)
+        if overwrite is None:
+            self._overwrites.pop(target, None)
+        else:
+            self._overwrites[target] = overwrite
+
+    async def send(self, content=None, *, embed=None, embeds=None):
+        await self._http.request("POST", "/channels/{channel_id}/messages", self.id)
+        self.sent += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, http: FakeHTTP, channels: int = 50, members: int = 0):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.http = http
+        self.default_role = FakeRole(guild_id, "@everyone", self)
+        self.roles = [self.default_role, FakeRole(guild_id + 1, "Admin", self)]
+        self.channels = [FakeChannel(guild_id + 1000 + i, self, http) for i in range(channels)]
+        self.members = [FakeMember(guild_id + 10**6 + i, f"member{i}", self, http) for i in range(members)]
+        self.owner = FakeMember(guild_id + 7, "owner", self, http, administrator=True)
+        self.owner_id = self.owner.id
+        self._members = {m.id: m for m in self.members}
+        self.chunked = True
+        self.audit_entries = []
+        self.banned = set()
+
+    def get_member(self, member_id: int):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id: int):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def ban(self, user, **kwargs):
+        await self.http.request("PUT", "/guilds/{guild_id}/bans/{user_id}", self.id)
+        self.banned.add(user.id)
+
+    async def kick(self, user, **kwargs):
+        await self.http.request("DELETE", "/guilds/{guild_id}/members/{user_id}", self.id)
+
+    async def bulk_ban(self, users, **kwargs):
+        await self.http.request("POST", "/guilds/{guild_id}/bulk-ban", self.id)
+        return SimpleNamespace(banned=list(users), failed=[])
+
+    async def audit_logs(self, *, limit, after):
+        await self.http.request("GET", "/guilds/{guild_id}/audit-logs", self.id)
+        for entry in [e for e in self.audit_entries if e.id > after.id][:limit]:
+            yield entry
+
+    async def query_members(self, *, user_ids, **kwargs):
+        return [self._members[user_id] for user_id in user_ids if user_id in self._members]
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def _callback(self):
+        self._interaction.new_token()
+        await self._interaction._http.request("POST", "/interactions/{interaction_id}/callback", self._interaction.id)
+
+    async def defer(self, **kwargs):
+        await self._callback()
+
+    async def send_message(self, *args, **kwargs):
+        await self._callback()
+
+    async def send_modal(self, modal):
+        await self._callback()
+
+    async def edit_message(self, **kwargs):
+        await self._callback()
+
+
+class FakeInteraction:
+    _ids = iter(range(1, 1 << 62))
+
+    def __init__(self, guild: FakeGuild, user: FakeMember, http: FakeHTTP):
+        self.guild = guild
+        self.user = user
+        self.response = FakeResponse(self)
+        self._http = http
+        self.id = next(self._ids)
+
+    def new_token(self):
+        # Each replayed submit is a fresh interaction with its own buckets
+        self.id = next(self._ids)
+
+    async def edit_original_response(self, **kwargs):
+        await self._http.request("PATCH", "/webhooks/{application_id}/{token}/messages/@original", self.id)
+
+
+# Replay scenarios
+class Sample:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.elapsed = 0.0
+        self.peak_memory = 0
+        self.extra = {}
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies) or [0.0]
+        count = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "operations": count,
+            "elapsed_s": round(self.elapsed, 4),
+            "throughput_per_s": round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": round(latencies[int(0.50 * (len(latencies) - 1))] * 1e3, 3),
+            "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1e3, 3),
+            "peak_mem_kb": round(self.peak_memory / 1024, 1),
+            **self.extra,
+        }
+
+
+TRACE_MEMORY = True
+
+
+async def measure(sample: Sample, operations):
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for operation in operations:
+        op_start = time.perf_counter()
+        await operation()
+        sample.latencies.append(time.perf_counter() - op_start)
+    sample.elapsed = time.perf_counter() - start
+    if TRACE_MEMORY:
+        sample.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return sample
+
+
+async def scenario_nuke_burst(http: FakeHTTP, attackers: int, actions_each: int) -> Sample:
+    guild = FakeGuild(11 << 22, http, channels=0)
+    attackers = [FakeMember(guild.id + 50 + i, f"attacker{i}", guild, http) for i in range(attackers)]
+    guild._members.update((m.id, m) for m in attackers)
+    events = [(member, action) for member in attackers for action in ("channel_deletes", "role_deletes", "bans")
+              for _ in range(actions_each)]
+    random.Random(0).shuffle(events)
+    anti_nuke = bot.AntiNukeSystem()
+    triggered = 0
+
+    def handle(member, action):
+        async def operation():
+            nonlocal triggered
+            # A banned account cannot act any more
+            if member.id in guild.banned:
+                return
+            anti_nuke.log_activity(member.id, action, guild.id)
+            if anti_nuke.check_limits(member.id, action, guild.id) and not anti_nuke.responding(guild.id, member.id):
+                triggered += 1
+                await anti_nuke.handle_nuke_attempt(member, action)
+        return operation
+
+    sample = await measure(Sample("anti_nuke: nuke burst"), [handle(m, a) for m, a in events])
+    sample.extra["triggers"] = triggered
+    return sample
+
+
+async def scenario_audit_attribution(http: FakeHTTP, deletes: int) -> Sample:
+    # A channel-delete burst whose audit entries land 50-300ms after each gateway event
+    guild = FakeGuild(17 << 22, http, channels=deletes)
+    attackers = [FakeMember(guild.id + 50 + i, f"nuker{i}", guild, http) for i in range(3)]
+    guild._members.update((m.id, m) for m in attackers)
+    watcher = bot.AuditLogWatcher()
+    rng = random.Random(0)
+    events = []
+
+    async def write_entry(channel, attacker):
+        await asyncio.sleep(rng.uniform(0.05, 0.3))
+        guild.audit_entries.append(SimpleNamespace(id=discord.utils.time_snowflake(discord.utils.utcnow()),
+                                                   user=attacker, target=channel,
+                                                   action=discord.AuditLogAction.channel_delete))
+
+    def delete(i, channel):
+        async def operation():
+            asyncio.create_task(write_entry(channel, attackers[i % 3]))
+            events.append(asyncio.create_task(watcher.attribute(guild, discord.AuditLogAction.channel_delete,
+                                                                channel.id, "channel_deletes")))
+        return operation
+
+    before = http.requests
+    sample = await measure(Sample(f"audit attribution: {deletes} deletes"),
+                           [delete(i, c) for i, c in enumerate(guild.channels)])
+    start = time.perf_counter()
+    await asyncio.gather(*events)
+    sample.extra["settle_ms"] = round((time.perf_counter() - start) * 1e3, 1)
+    sample.extra["audit_fetches"] = watcher.fetches
+    sample.extra["requests"] = http.requests - before
+    sample.extra["banned"] = len(guild.banned & {m.id for m in attackers})
+    return sample
+
+
+async def scenario_join_raid(http: FakeHTTP, joins: int) -> Sample:
+    guild = FakeGuild(12 << 22, http, channels=0)
+    CONFIG["guild_overrides"][str(guild.id)] = {"raid": {"mode": "quarantine", "quarantine_role_id": guild.roles[1].id}}
+    detector = RaidDetector()
+    triggered = []
+    original_trigger = detector.trigger
+
+    async def trigger(*args):
+        triggered.append(time.perf_counter())
+        await original_trigger(*args)
+
+    detector.trigger = trigger
+    rng = random.Random(0)
+    members = [FakeMember(guild.id + 10**6 + i, f"raider{rng.randrange(1000)}", guild, http,
+                          age_days=rng.random() * 3, avatar=False) for i in range(joins)]
+    # Joiners are cached even in low-memory mode (MemberCacheFlags.joined)
+    guild._members.update((m.id, m) for m in members)
+
+    def join(member):
+        async def operation():
+            detector.on_join(member)
+        return operation
+
+    start = time.perf_counter()
+    sample = await measure(Sample("raid: join burst"), [join(m) for m in members])
+    # Let the last micro-batch flush and be scored
+    while detector._flushers or detector._buffers:
+        await asyncio.sleep(0.05)
+    sample.extra["detected_after_ms"] = round((triggered[0] - start) * 1e3, 1) if triggered else None
+    del CONFIG["guild_overrides"][str(guild.id)]
+    bot._guild_configs.pop(guild.id, None)
+    return sample
+
+
+async def scenario_mass_warns(http: FakeHTTP, warns: int) -> Sample:
+    guild = FakeGuild(13 << 22, http, channels=0, members=max(1, warns // 5))
+    interaction = FakeInteraction(guild, guild.owner, http)
+
+    def warn(member):
+        async def operation():
+            modal = bot.WarnModal(member)
+            modal.reason._value = "spam"
+            await modal.on_submit(interaction)
+        return operation
+
+    targets = [guild.members[i % len(guild.members)] for i in range(warns)]
+    sample = await measure(Sample("WarnModal: mass warns"), [warn(m) for m in targets])
+    sample.extra["active_warnings"] = bot.guild_states.get(guild.id).warnings.total
+    return sample
+
+
+async def scenario_lockdown(http: FakeHTTP, channels: int) -> Sample:
+    guild = FakeGuild(14 << 22, http, channels=channels)
+    interaction = FakeInteraction(guild, guild.owner, http)
+    view = bot.QuickActions()
+    sample = await measure(Sample(f"lockdown+unlock: {channels} channels"), [
+        lambda: view.lockdown_button.callback(interaction),
+        lambda: view.unlock_button.callback(interaction),
+    ])
+    sample.extra["restored"] = all(not c._overwrites for c in guild.channels)
+    return sample
+
+
+async def scenario_bulk_moderation(http: FakeHTTP, raiders: int) -> Sample:
+    guild = FakeGuild(16 << 22, http, channels=0, members=50)
+    rng = random.Random(0)
+    # Listed IDs are parsed as 15-20 digit snowflakes
+    raid = [FakeMember(10**17 + i, f"raider{rng.randrange(10_000)}", guild, http) for i in range(raiders)]
+    # Kicks share one per-guild bucket, so the kick wave is kept small
+    spam = [FakeMember(guild.id + 2 * 10**7 + i, f"spammer{i}", guild, http) for i in range(raiders // 10)]
+    guild.members.extend(raid + spam)
+    guild._members.update((m.id, m) for m in raid + spam)
+    interaction = FakeInteraction(guild, guild.owner, http)
+    requests = {}
+    selected = {}
+
+    def run(action, ids, pattern):
+        async def operation():
+            before = http.requests
+            targets, _ = await bot.bulk_moderation.select(guild, ids, pattern=pattern, exclude=(guild.owner.id,))
+            view = bot.BulkModerationView(guild.owner.id, action, targets, "bench", action, 60, 0)
+            await view.confirm.callback(interaction)
+            requests[action] = http.requests - before
+            selected[action] = len(targets)
+        return operation
+
+    listed = " ".join(str(m.id) for m in raid)
+    sample = await measure(Sample(f"bulk_moderate: {raiders} raiders"), [
+        run("ban", listed + " " + listed, None),
+        run("kick", "", "spammer*"),
+    ])
+    sample.extra.update({f"{action}_requests": count for action, count in requests.items()})
+    sample.extra.update({f"{action}_targets": count for action, count in selected.items()})
+    return sample
+
+
+async def scenario_log_action(http: FakeHTTP, events: int) -> Sample:
+    guild = FakeGuild(15 << 22, http, channels=0, members=100)
+    log_channel = FakeChannel(1, guild, http)
+    bot.bot.get_channel = lambda channel_id: log_channel
+
+    def log(member):
+        async def operation():
+            await bot.SecurityUtils.log_action("User banned", member, guild.owner, "bench")
+        return operation
+
+    sample = await measure(Sample("log_action: enqueue"), [log(guild.members[i % 100]) for i in range(events)])
+    flush_start = time.perf_counter()
+    await bot.log_dispatcher.flush()
+    sample.extra["flush_ms"] = round((time.perf_counter() - flush_start) * 1e3, 1)
+    sample.extra["messages_sent"] = log_channel.sent
+    return sample
+
+
+async def scenario_security_check(http: FakeHTTP, guilds: int, warnings_each: int) -> Sample:
+    for g in range(guilds):
+        state = bot.guild_states.get((16 << 22) + g)
+        for i in range(warnings_each):
+            state.add_warning(i % 500, 1, "bench")
+    await bot.guild_states.store.flush()
+    sample = await measure(Sample(f"security_check: {guilds} guilds x {warnings_each} warns"),
+                           [bot.security_check.coro for _ in range(5)])
+    await bot.guild_states.store.flush()
+    return sample
+
+
+async def run_replay(full: bool) -> list:
+    # Journal, lockdown and backlog files go to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="security-bench-"))
+    bot.log_dispatcher.flush_interval = 3600
+    http = FakeHTTP()
+    bot.bot._connection.user = FakeMember(1, "SecurityBot", FakeGuild(0, http, channels=0), http)
+    samples = [
+        await scenario_nuke_burst(http, attackers=50 if full else 20, actions_each=5),
+        await scenario_audit_attribution(http, deletes=200 if full else 50),
+        await scenario_join_raid(http, joins=2000 if full else 500),
+        await scenario_mass_warns(http, warns=2000 if full else 300),
+        await scenario_lockdown(http, channels=500 if full else 100),
+        await scenario_bulk_moderation(http, raiders=1000 if full else 300),
+        await scenario_log_action(http, events=5000 if full else 1000),
+        await scenario_security_check(http, guilds=50 if full else 10, warnings_each=1000),
+    ]
+    await bot.log_dispatcher.flush()
+    await bot.guild_states.store.close()
+    reports = [sample.report() for sample in samples]
+    print(f"Replay (stub HTTP: {http.requests} requests, {http.rate_limited} rate-limit waits)")
+    print(f"{'scenario':<42} {'ops':>7} {'ops/sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>9}  notes")
+    for report in reports:
+        notes = ", ".join(f"{k}={v}" for k, v in report.items()
+                          if k not in ("scenario", "operations", "elapsed_s", "throughput_per_s", "p50_ms", "p99_ms", "peak_mem_kb"))
+        print(f"{report['scenario']:<42} {report['operations']:>7} {report['throughput_per_s']:>10} "
+              f"{report['p50_ms']:>9} {report['p99_ms']:>9} {report['peak_mem_kb']:>9}  {notes}")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Security bot benchmarks")
+    parser.add_argument("--only", choices=("micro", "replay"), help="run one suite")
+    parser.add_argument("--full", action="store_true", help="use incident-sized replays")
+    parser.add_argument("--json", metavar="PATH", help="also write replay results as JSON")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc during replays")
+    args = parser.parse_args()
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    if args.only != "replay":
+        run_micro()
+        print()
+    if args.only != "micro":
+        reports = asyncio.run(run_replay(args.full))
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()